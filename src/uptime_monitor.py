@@ -4,15 +4,103 @@ Provides HTTP/TCP/Ping/DNS/Push monitoring with incident tracking and status pag
 """
 
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Iterator, Tuple
 import sqlite3
+import http.cookiejar
 import json
+import re
 import socket
 import subprocess
 import ssl
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import icmplib
+except ImportError:  # optional: fall back to the system ping binary
+    icmplib = None
+
+# Matched against raw ping stdout, so no decode is needed
+_PING_TIME_RE = re.compile(rb'time=([\d.]+)\s*ms')
+
+# SQL statements, kept in one place. Statement reuse comes from the pooled
+# connections: they are long-lived and opened with cached_statements, whose
+# cache is keyed by SQL text, so an identical inline literal would hit it too.
+_SQL_INSERT_MONITOR = '''
+    INSERT INTO monitors
+    (id, name, type, target, interval_s, timeout_s, tags, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_SELECT_MONITOR = '''
+    SELECT id, type, status, up_since, target, timeout_s
+    FROM monitors WHERE id = ?
+'''
+_SQL_SELECT_ACTIVE_MONITORS = '''
+    SELECT id, type, status, up_since, target, timeout_s
+    FROM monitors WHERE status != ?
+'''
+_SQL_SELECT_MONITOR_STATUS = 'SELECT id, name, status, response_time_ms FROM monitors'
+_SQL_UPDATE_MONITOR_CHECK = '''
+    UPDATE monitors
+    SET status = ?, last_check = ?, response_time_ms = ?, cert_expiry_days = ?, up_since = ?
+    WHERE id = ?
+'''
+_SQL_INSERT_HEARTBEAT = '''
+    INSERT INTO heartbeats (monitor_id, timestamp, status, response_time_ms)
+    VALUES (?, ?, ?, ?)
+'''
+_SQL_INSERT_INCIDENT = '''
+    INSERT INTO incidents (id, monitor_id, started_at, cause)
+    VALUES (?, ?, ?, ?)
+'''
+_SQL_SELECT_STATUS_PAGE = 'SELECT * FROM status_pages WHERE slug = ?'
+# {where} is empty or an ``m.id IN (...)`` filter from _monitor_filter
+_SQL_UPTIME_ALL = '''
+    SELECT m.id,
+           MAX(0.0, 100.0 * (1 - COALESCE(SUM(i.duration_s), 0.0) / (? * 86400.0)))
+    FROM monitors m
+    LEFT JOIN incidents i ON i.monitor_id = m.id AND i.started_at > ?
+    {where}
+    GROUP BY m.id
+'''
+_SQL_RESPONSE_TIME_AVG_ALL = '''
+    SELECT m.id, COALESCE(AVG(h.response_time_ms), 0.0) FROM monitors m
+    LEFT JOIN heartbeats h ON h.monitor_id = m.id AND h.timestamp > ?
+        AND h.response_time_ms IS NOT NULL
+    {where}
+    GROUP BY m.id
+'''
+_SQL_SELECT_INCIDENTS = '''
+    SELECT id, monitor_id, started_at, resolved_at, duration_s, cause, notified
+    FROM incidents
+'''
+_SQL_SELECT_INCIDENT_START = 'SELECT started_at FROM incidents WHERE id = ?'
+_SQL_RESOLVE_INCIDENT = '''
+    UPDATE incidents
+    SET resolved_at = ?, duration_s = ?
+    WHERE id = ?
+'''
+_SQL_DELETE_OLD_HEARTBEATS = 'DELETE FROM heartbeats WHERE timestamp < ?'
+_SQL_SELECT_HEARTBEATS = '''
+    SELECT timestamp, status, response_time_ms FROM heartbeats
+    WHERE monitor_id = ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+'''
+
+
+def _dict_factory(cursor: sqlite3.Cursor, row: tuple) -> Dict:
+    """sqlite3 row factory that builds a dict keyed by column name."""
+    return {col[0]: value for col, value in zip(cursor.description, row)}
 
 
 @dataclass
@@ -55,22 +143,114 @@ class StatusPage:
     description: str = ""
     logo_url: str = ""
     theme: str = "light"
+    uptime_percent: Dict[str, float] = field(default_factory=dict)
+    response_time_avg_ms: Dict[str, float] = field(default_factory=dict)
 
 
 class UptimeMonitor:
     """Core uptime monitoring engine."""
 
-    def __init__(self, db_path: Optional[str] = None):
+    _CERT_CACHE_TTL = timedelta(hours=1)
+    _CERT_REFRESH_WINDOW = timedelta(days=7)
+    _MAINTENANCE_INTERVAL_S = 3600
+    _INCIDENT_BATCH = 500
+
+    def __init__(self, db_path: Optional[str] = None,
+                 pool_size: Optional[int] = None):
         if db_path is None:
             db_path = Path.home() / ".blackroad" / "uptime.db"
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # host -> (cert expiry, fetched at)
+        self._cert_cache: Dict[str, Tuple[datetime, datetime]] = {}
+        # Built once; sessions are deliberately not resumed (see _get_cert_expiry)
+        self._ssl_ctx = ssl.create_default_context()
+        self._cert_lock = threading.Lock()
+
+        # Shared session so repeat checks reuse keep-alive connections; cookies
+        # are refused so each check stays as stateless as a bare requests.get
+        self._http = requests.Session()
+        self._http.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+        # One writer (SQLite serializes writes anyway) plus a pool of readers
+        self._write_lock = threading.Lock()
+        self._write_conn = self._connect()
         self._init_db()
+        # Short-lived processes (e.g. the CLI) never reach the first run;
+        # they should call vacuum_old_heartbeats explicitly
+        self._last_maintenance = time.monotonic()
+
+        self.pool_size = pool_size or os.cpu_count() or 4
+        self._readers: queue.Queue = queue.Queue()
+        for _ in range(self.pool_size):
+            self._readers.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the per-connection PRAGMAs applied."""
+        # isolation_level=None: no implicit BEGINs; _write() manages transactions
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               cached_statements=256, isolation_level=None)
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-20000')
+        conn.execute('PRAGMA wal_autocheckpoint=1000')
+        return conn
+
+    @contextmanager
+    def _read(self):
+        """Borrow a reader connection from the pool and yield a cursor."""
+        conn = self._readers.get()
+        try:
+            yield conn.cursor()
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def _write(self):
+        """Yield a cursor on the writer inside a BEGIN IMMEDIATE transaction."""
+        with self._write_lock:
+            conn = self._write_conn
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            try:
+                yield c
+            except BaseException:
+                if conn.in_transaction:
+                    c.execute('ROLLBACK')
+                raise
+            c.execute('COMMIT')
+
+    def close(self):
+        """Close all pooled connections."""
+        self._http.close()
+        with self._write_lock:
+            self._write_conn.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
 
     def _init_db(self):
         """Initialize SQLite database schema."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+        # Both are persistent in the file and must be set outside a transaction;
+        # auto_vacuum only takes effect if set before the first table is created
+        self._write_conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self._write_conn.execute('PRAGMA journal_mode=WAL')
+        with self._write() as c:
+            self._create_schema(c)
+
+        # Files created before auto_vacuum was set still read 0, which makes
+        # incremental_vacuum a no-op; a one-time VACUUM rebuilds them with it on
+        with self._write_lock:
+            if self._write_conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 0:
+                self._write_conn.execute('VACUUM')
+
+    def _create_schema(self, c: sqlite3.Cursor):
+        """Create tables on the given cursor."""
         c.execute('''
             CREATE TABLE IF NOT EXISTS monitors (
                 id TEXT PRIMARY KEY,
@@ -122,8 +302,28 @@ class UptimeMonitor:
                 theme TEXT DEFAULT 'light'
             )
         ''')
-        conn.commit()
-        conn.close()
+
+        # Indexes backing the per-monitor time-window queries
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_hb_mon_ts
+            ON heartbeats(monitor_id, timestamp DESC)
+        ''')
+        # (started_at, id) matches iter_incidents' ORDER BY and keyset, so its
+        # batches are seeks; the monitor-scoped index also serves uptime windows
+        # and supersedes the earlier idx_inc_mon_started
+        c.execute('DROP INDEX IF EXISTS idx_inc_mon_started')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_inc_mon_started_id
+            ON incidents(monitor_id, started_at, id)
+        ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_inc_started_id
+            ON incidents(started_at, id)
+        ''')
+        c.execute('''
+            CREATE INDEX IF NOT EXISTS idx_inc_monitor_resolved
+            ON incidents(monitor_id) WHERE resolved_at IS NULL
+        ''')
 
     def add_monitor(self, name: str, monitor_type: str, target: str,
                     interval_s: int = 60, timeout_s: int = 10,
@@ -133,40 +333,46 @@ class UptimeMonitor:
         monitor_id = str(uuid.uuid4())[:8]
         tags = tags or []
 
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO monitors
-            (id, name, type, target, interval_s, timeout_s, tags, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (monitor_id, name, monitor_type, target, interval_s, timeout_s,
-              json.dumps(tags), datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        with self._write() as c:
+            c.execute(_SQL_INSERT_MONITOR, (
+                monitor_id, name, monitor_type, target, interval_s, timeout_s,
+                json.dumps(tags), datetime.now().isoformat()))
         return monitor_id
 
+    def _load_monitor(self, monitor_id: str) -> Optional[sqlite3.Row]:
+        """Fetch the columns a check needs for one monitor."""
+        with self._read() as c:
+            c.row_factory = sqlite3.Row
+            c.execute(_SQL_SELECT_MONITOR, (monitor_id,))
+            return c.fetchone()
+
+    def _load_active_monitors(self) -> List[sqlite3.Row]:
+        """Fetch the columns a check needs for every non-paused monitor."""
+        with self._read() as c:
+            c.row_factory = sqlite3.Row
+            c.execute(_SQL_SELECT_ACTIVE_MONITORS, ('paused',))
+            return c.fetchall()
+
     def check_http(self, monitor_id: str) -> Dict:
         """Check HTTP(S) endpoint."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT target, timeout_s FROM monitors WHERE id = ?', (monitor_id,))
-        row = c.fetchone()
-        conn.close()
-
-        if not row:
+        monitor = self._load_monitor(monitor_id)
+        if not monitor:
             return {"status": "error", "reason": "monitor not found"}
+        return self._check_http(monitor)
 
-        target, timeout = row
+    def _check_http(self, monitor: sqlite3.Row) -> Dict:
+        """Check HTTP(S) endpoint for a pre-loaded monitor row."""
+        target, timeout = monitor["target"], monitor["timeout_s"]
         try:
-            start = datetime.now()
-            response = requests.get(target, timeout=timeout)
-            response_time = (datetime.now() - start).total_seconds() * 1000
+            start = time.perf_counter()
+            response = self._http.get(target, timeout=timeout)
+            response_time = (time.perf_counter() - start) * 1000.0
             status = "up" if response.status_code < 400 else "down"
             
             # Check SSL cert expiry if HTTPS
             if target.startswith("https://"):
                 try:
-                    cert_expiry = self._get_cert_expiry(target)
+                    cert_expiry = self._get_cert_expiry(target, timeout)
                 except:
                     cert_expiry = None
             else:
@@ -183,24 +389,22 @@ class UptimeMonitor:
 
     def check_tcp(self, monitor_id: str) -> Dict:
         """Check TCP port connectivity."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT target, timeout_s FROM monitors WHERE id = ?', (monitor_id,))
-        row = c.fetchone()
-        conn.close()
-
-        if not row:
+        monitor = self._load_monitor(monitor_id)
+        if not monitor:
             return {"status": "error", "reason": "monitor not found"}
+        return self._check_tcp(monitor)
 
-        target, timeout = row
+    def _check_tcp(self, monitor: sqlite3.Row) -> Dict:
+        """Check TCP port connectivity for a pre-loaded monitor row."""
+        target, timeout = monitor["target"], monitor["timeout_s"]
         try:
             parts = target.split(':')
             host = parts[0]
             port = int(parts[1]) if len(parts) > 1 else 80
 
-            start = datetime.now()
+            start = time.perf_counter()
             sock = socket.create_connection((host, port), timeout=timeout)
-            response_time = (datetime.now() - start).total_seconds() * 1000
+            response_time = (time.perf_counter() - start) * 1000.0
             sock.close()
             return {"status": "up", "response_time_ms": response_time}
         except Exception as e:
@@ -208,23 +412,34 @@ class UptimeMonitor:
 
     def check_ping(self, monitor_id: str) -> Dict:
         """Check ICMP ping."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT target FROM monitors WHERE id = ?', (monitor_id,))
-        row = c.fetchone()
-        conn.close()
-
-        if not row:
+        monitor = self._load_monitor(monitor_id)
+        if not monitor:
             return {"status": "error", "reason": "monitor not found"}
-
-        target = row[0]
+        return self._check_ping(monitor)
+
+    def _check_ping(self, monitor: sqlite3.Row) -> Dict:
+        """Check ICMP ping for a pre-loaded monitor row."""
+        target, timeout = monitor["target"], monitor["timeout_s"]
+        if icmplib is not None:
+            try:
+                host = icmplib.ping(target, count=1, timeout=timeout, privileged=False)
+                if host.is_alive:
+                    return {"status": "up", "response_time_ms": host.avg_rtt}
+                return {"status": "down"}
+            except icmplib.SocketPermissionError:
+                pass  # unprivileged ICMP sockets disabled on this host
+            except Exception as e:
+                return {"status": "down", "reason": str(e)}
+        return self._ping_subprocess(target, timeout)
+
+    def _ping_subprocess(self, target: str, timeout: int) -> Dict:
+        """Check ICMP ping by shelling out to the system ping binary."""
         try:
-            result = subprocess.run(['ping', '-c', '1', '-W', '5', target],
-                                  capture_output=True, timeout=10)
+            result = subprocess.run(['ping', '-c', '1', '-W', str(timeout), target],
+                                  capture_output=True, timeout=timeout)
             if result.returncode == 0:
                 # Extract response time from ping output
-                import re
-                match = re.search(r'time=([\d.]+)\s*ms', result.stdout.decode())
+                match = _PING_TIME_RE.search(result.stdout)
                 response_time = float(match.group(1)) if match else 0
                 return {"status": "up", "response_time_ms": response_time}
             else:
@@ -234,240 +449,343 @@ class UptimeMonitor:
 
     def check_cert(self, monitor_id: str) -> Dict:
         """Check SSL certificate expiry."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT target FROM monitors WHERE id = ?', (monitor_id,))
-        row = c.fetchone()
-        conn.close()
-
-        if not row:
+        monitor = self._load_monitor(monitor_id)
+        if not monitor:
             return {"status": "error", "reason": "monitor not found"}
+        return self._check_cert(monitor)
 
-        target = row[0]
+    def _check_cert(self, monitor: sqlite3.Row) -> Dict:
+        """Check SSL certificate expiry for a pre-loaded monitor row."""
         try:
-            cert_expiry_days = self._get_cert_expiry(target)
+            cert_expiry_days = self._get_cert_expiry(monitor["target"], monitor["timeout_s"])
             return {"status": "up", "cert_expiry_days": cert_expiry_days}
         except Exception as e:
             return {"status": "error", "reason": str(e)}
 
-    def _get_cert_expiry(self, url: str) -> Optional[int]:
-        """Get SSL certificate expiry days remaining."""
+    def _get_cert_expiry(self, url: str, timeout: int = 10) -> Optional[int]:
+        """Get SSL certificate expiry days remaining.
+
+        Expiry is cached per host for ``_CERT_CACHE_TTL`` and re-fetched early
+        once the certificate is inside ``_CERT_REFRESH_WINDOW`` of expiring.
+        """
         from urllib.parse import urlparse
         parsed = urlparse(url)
         host = parsed.netloc.split(':')[0]
 
-        context = ssl.create_default_context()
-        with socket.create_connection((host, 443), timeout=10) as sock:
-            with context.wrap_socket(sock, server_hostname=host) as ssock:
+        now = datetime.now(timezone.utc)
+        with self._cert_lock:
+            cached = self._cert_cache.get(host)
+        if cached:
+            expiry_dt, fetched_at = cached
+            if (now - fetched_at < self._CERT_CACHE_TTL
+                    and expiry_dt - now >= self._CERT_REFRESH_WINDOW):
+                return (expiry_dt - now).days
+
+        with socket.create_connection((host, 443), timeout=timeout) as sock:
+            # No session resumption: a resumed handshake carries no certificate,
+            # so getpeercert() would return the one cached in the session and
+            # never see a renewal
+            with self._ssl_ctx.wrap_socket(sock, server_hostname=host) as ssock:
                 cert = ssock.getpeercert()
-                import ssl as ssl_module
                 expiry_str = cert.get('notAfter')
                 # Parse SSL date format
                 from email.utils import parsedate_to_datetime
                 expiry_dt = parsedate_to_datetime(expiry_str)
-                days_left = (expiry_dt - datetime.now(expiry_dt.tzinfo)).days
-                return days_left
 
-    def run_check(self, monitor_id: str) -> bool:
-        """Run check for a monitor; create incident if down."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT type, status FROM monitors WHERE id = ?', (monitor_id,))
-        row = c.fetchone()
-        
-        if not row:
-            return False
+        with self._cert_lock:
+            self._cert_cache[host] = (expiry_dt, now)
+        return (expiry_dt - now).days
 
-        monitor_type, old_status = row
+    def _compute_result(self, monitor: sqlite3.Row) -> Dict:
+        """Run the check for a monitor row without writing anything to the DB."""
+        monitor_type = monitor["type"]
 
         # Dispatch to appropriate check
         if monitor_type == "http":
-            result = self.check_http(monitor_id)
+            result = self._check_http(monitor)
         elif monitor_type == "tcp":
-            result = self.check_tcp(monitor_id)
+            result = self._check_tcp(monitor)
         elif monitor_type == "ping":
-            result = self.check_ping(monitor_id)
+            result = self._check_ping(monitor)
         elif monitor_type == "dns":
-            result = self.check_ping(monitor_id)  # Simplified
+            result = self._check_ping(monitor)  # Simplified
         else:
             result = {"status": "unknown"}
 
-        new_status = result.get("status", "unknown")
-        response_time = result.get("response_time_ms")
-        cert_expiry = result.get("cert_expiry_days")
+        return self._make_result(monitor, result)
+
+    def _make_result(self, monitor: sqlite3.Row, result: Dict) -> Dict:
+        """Combine a check outcome with the monitor state _apply_results needs."""
+        return {
+            "monitor_id": monitor["id"],
+            "old_status": monitor["status"],
+            "up_since": monitor["up_since"],
+            "status": result.get("status", "unknown"),
+            "response_time_ms": result.get("response_time_ms"),
+            "cert_expiry_days": result.get("cert_expiry_days"),
+            "reason": result.get("reason", "Monitor down"),
+            "checked_at": datetime.now().isoformat(),
+        }
+
+    def _apply_results(self, batch: List[Dict]):
+        """Persist a batch of check results in a single transaction."""
+        if not batch:
+            return
 
-        # Update monitor
-        now = datetime.now().isoformat()
-        if new_status == "up":
-            up_since = up_since if (up_since := c.execute(
-                'SELECT up_since FROM monitors WHERE id = ?', (monitor_id,)).fetchone()[0]) else now
-        else:
-            up_since = None
+        import uuid
+        with self._write() as c:
+            updates = []
+            heartbeats = []
+            incidents = []
+            for r in batch:
+                monitor_id, now = r["monitor_id"], r["checked_at"]
+                up_since = (r["up_since"] or now) if r["status"] == "up" else None
+
+                updates.append((r["status"], now, r["response_time_ms"],
+                                r["cert_expiry_days"], up_since, monitor_id))
+                heartbeats.append((monitor_id, now, r["status"], r["response_time_ms"]))
+
+                # Create incident if status changed from up to down
+                if r["old_status"] == "up" and r["status"] == "down":
+                    incidents.append((str(uuid.uuid4())[:8], monitor_id, now, r["reason"]))
+
+            c.executemany(_SQL_UPDATE_MONITOR_CHECK, updates)
+            c.executemany(_SQL_INSERT_HEARTBEAT, heartbeats)
+            if incidents:
+                c.executemany(_SQL_INSERT_INCIDENT, incidents)
 
-        c.execute('''
-            UPDATE monitors
-            SET status = ?, last_check = ?, response_time_ms = ?, cert_expiry_days = ?, up_since = ?
-            WHERE id = ?
-        ''', (new_status, now, response_time, cert_expiry, up_since, monitor_id))
+    def run_check(self, monitor_id: str) -> bool:
+        """Run check for a monitor; create incident if down."""
+        monitor = self._load_monitor(monitor_id)
+        if monitor is None:
+            return False
 
-        # Record heartbeat
-        c.execute('''
-            INSERT INTO heartbeats (monitor_id, timestamp, status, response_time_ms)
-            VALUES (?, ?, ?, ?)
-        ''', (monitor_id, now, new_status, response_time))
-
-        # Create incident if status changed from up to down
-        if old_status == "up" and new_status == "down":
-            import uuid
-            incident_id = str(uuid.uuid4())[:8]
-            c.execute('''
-                INSERT INTO incidents (id, monitor_id, started_at, cause)
-                VALUES (?, ?, ?, ?)
-            ''', (incident_id, monitor_id, now, result.get("reason", "Monitor down")))
-
-        conn.commit()
-        conn.close()
-        return new_status == "up"
-
-    def run_all_checks(self) -> Dict[str, bool]:
-        """Run checks for all active monitors."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT id FROM monitors WHERE status != ?', ('paused',))
-        monitors = c.fetchall()
-        conn.close()
-
-        results = {}
-        for (monitor_id,) in monitors:
-            results[monitor_id] = self.run_check(monitor_id)
+        result = self._compute_result(monitor)
+        self._apply_results([result])
+        return result["status"] == "up"
+
+    def run_all_checks(self, deadline_s: float = 60) -> Dict[str, bool]:
+        """Run checks for all active monitors concurrently.
+
+        Results are written in one transaction once every check has finished
+        or ``deadline_s`` has passed. Checks still running at the deadline are
+        recorded as down; checks still queued behind the worker cap never ran,
+        so they are left out of the results and keep their previous status.
+
+        ``deadline_s`` bounds when this returns, not when the process can exit:
+        the interpreter joins abandoned worker threads on shutdown. A probe's
+        own timeouts bound it only loosely, since ``requests`` applies
+        ``timeout_s`` per socket operation and HTTPS checks fetch the
+        certificate over a second connection with its own timeout, so one
+        probe can run for several multiples of ``timeout_s``.
+        """
+        monitors = self._load_active_monitors()
+        if not monitors:
+            return {}
+
+        executor = ThreadPoolExecutor(max_workers=min(32, len(monitors)))
+        try:
+            futures = {executor.submit(self._compute_result, monitor): monitor
+                       for monitor in monitors}
+            try:
+                for _ in as_completed(futures, timeout=deadline_s):
+                    pass
+            except FuturesTimeoutError:
+                pass
+        finally:
+            # Don't let a hung check hold the cycle open past the deadline;
+            # its thread keeps running until the probe itself gives up
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # Collect whatever finished (even after the deadline fired) and record
+        # started checks that overran or raised as down. Cancelled futures never
+        # started, so there is nothing to record for them this cycle.
+        batch = []
+        for future, monitor in futures.items():
+            if future.cancelled():
+                continue
+            if not future.done():
+                result = self._make_result(
+                    monitor, {"status": "down", "reason": "check timed out"})
+            elif future.exception() is not None:
+                result = self._make_result(
+                    monitor, {"status": "down", "reason": f"check failed: {future.exception()}"})
+            else:
+                result = future.result()
+            batch.append(result)
+
+        self._apply_results(batch)
+        results = {r["monitor_id"]: r["status"] == "up" for r in batch}
+        if time.monotonic() - self._last_maintenance >= self._MAINTENANCE_INTERVAL_S:
+            self.vacuum_old_heartbeats()
         return results
 
     def get_status_page(self, slug: str) -> Optional[StatusPage]:
         """Get a status page with current monitor statuses."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT * FROM status_pages WHERE slug = ?', (slug,))
-        row = c.fetchone()
-        
+        with self._read() as c:
+            c.execute(_SQL_SELECT_STATUS_PAGE, (slug,))
+            row = c.fetchone()
+
         if not row:
             return None
-        
-        conn.close()
-        return StatusPage(*row)
 
-    def get_uptime_percent(self, monitor_id: str, days: int = 30) -> float:
-        """Calculate uptime percentage from incident history."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+        page = StatusPage(*row)
+        monitor_ids = json.loads(page.monitors or '[]')
+        page.uptime_percent = self.get_uptime_percent_all(monitor_ids=monitor_ids)
+        page.response_time_avg_ms = self.get_response_time_avg_all(monitor_ids=monitor_ids)
+        return page
+
+    def _monitor_filter(self, monitor_ids: Optional[List[str]]) -> Tuple[str, List[str]]:
+        """Build an optional ``WHERE m.id IN (...)`` clause for the bulk stats."""
+        if monitor_ids is None:
+            return '', []
+        return f"WHERE m.id IN ({','.join('?' * len(monitor_ids))})", list(monitor_ids)
+
+    def get_uptime_percent_all(self, days: int = 30,
+                               monitor_ids: Optional[List[str]] = None) -> Dict[str, float]:
+        """Calculate uptime percentage for every monitor (or just ``monitor_ids``) in one query."""
+        if monitor_ids is not None and not monitor_ids:
+            return {}
         cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+        where, params = self._monitor_filter(monitor_ids)
 
-        c.execute('''
-            SELECT SUM(duration_s) FROM incidents
-            WHERE monitor_id = ? AND started_at > ?
-        ''', (monitor_id, cutoff))
-        
-        downtime = c.fetchone()[0] or 0
-        conn.close()
-
-        total_seconds = days * 86400
-        return max(0, (1 - downtime / total_seconds) * 100)
+        with self._read() as c:
+            c.execute(_SQL_UPTIME_ALL.format(where=where), [days, cutoff] + params)
+            return dict(c.fetchall())
 
-    def get_response_time_avg(self, monitor_id: str, hours: int = 24) -> float:
-        """Get average response time in ms over last N hours."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+    def get_response_time_avg_all(self, hours: int = 24,
+                                  monitor_ids: Optional[List[str]] = None) -> Dict[str, float]:
+        """Get average response time in ms for every monitor (or just ``monitor_ids``) in one query."""
+        if monitor_ids is not None and not monitor_ids:
+            return {}
         cutoff = (datetime.now() - timedelta(hours=hours)).isoformat()
+        where, params = self._monitor_filter(monitor_ids)
 
-        c.execute('''
-            SELECT AVG(response_time_ms) FROM heartbeats
-            WHERE monitor_id = ? AND timestamp > ? AND response_time_ms IS NOT NULL
-        ''', (monitor_id, cutoff))
-        
-        avg = c.fetchone()[0] or 0
-        conn.close()
-        return avg
+        with self._read() as c:
+            c.execute(_SQL_RESPONSE_TIME_AVG_ALL.format(where=where), [cutoff] + params)
+            return dict(c.fetchall())
 
-    def get_incidents(self, monitor_id: Optional[str] = None,
-                     open_only: bool = False) -> List[Incident]:
-        """Get incidents, optionally filtered."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+    def get_uptime_percent(self, monitor_id: str, days: int = 30) -> float:
+        """Calculate uptime percentage from incident history."""
+        return self.get_uptime_percent_all(days, [monitor_id]).get(monitor_id, 100.0)
 
-        query = 'SELECT * FROM incidents'
-        params = []
+    def get_response_time_avg(self, monitor_id: str, hours: int = 24) -> float:
+        """Get average response time in ms over last N hours."""
+        return self.get_response_time_avg_all(hours, [monitor_id]).get(monitor_id, 0.0)
+
+    def iter_incidents(self, monitor_id: Optional[str] = None,
+                       open_only: bool = False, limit: Optional[int] = None,
+                       offset: int = 0) -> Iterator[Incident]:
+        """Yield incidents oldest-first, optionally filtered and paginated.
+
+        Rows are read in batches of ``_INCIDENT_BATCH`` so a reader connection
+        is never held while the caller consumes the generator. ``offset`` only
+        applies to the first batch; later batches continue from the last row
+        read, so each is an index seek rather than a rescan.
+        """
+        filters = []
+        params: List = []
         if monitor_id:
-            query += ' WHERE monitor_id = ?'
+            filters.append('monitor_id = ?')
             params.append(monitor_id)
         if open_only:
-            if params:
-                query += ' AND resolved_at IS NULL'
-            else:
-                query += ' WHERE resolved_at IS NULL'
-
-        c.execute(query, params)
-        rows = c.fetchall()
-        conn.close()
-
-        incidents = []
-        for row in rows:
-            incidents.append(Incident(
-                id=row[0], monitor_id=row[1],
-                started_at=datetime.fromisoformat(row[2]),
-                resolved_at=datetime.fromisoformat(row[3]) if row[3] else None,
-                duration_s=row[4],
-                cause=row[5],
-                notified=bool(row[6])
-            ))
-        return incidents
+            filters.append('resolved_at IS NULL')
+
+        fromisoformat = datetime.fromisoformat
+        remaining = limit
+        last = None
+        while remaining is None or remaining > 0:
+            batch = self._INCIDENT_BATCH if remaining is None else min(self._INCIDENT_BATCH, remaining)
+            where = list(filters)
+            args = list(params)
+            if last is not None:
+                where.append('(started_at, id) > (?, ?)')
+                args.extend(last)
+            query = _SQL_SELECT_INCIDENTS
+            if where:
+                query += ' WHERE ' + ' AND '.join(where)
+            query += ' ORDER BY started_at, id LIMIT ? OFFSET ?'
+            args.extend([batch, offset if last is None else 0])
+
+            with self._read() as c:
+                c.row_factory = sqlite3.Row
+                c.execute(query, args)
+                rows = c.fetchall()
+
+            for row in rows:
+                yield Incident(
+                    id=row["id"], monitor_id=row["monitor_id"],
+                    started_at=fromisoformat(row["started_at"]),
+                    resolved_at=fromisoformat(row["resolved_at"]) if row["resolved_at"] else None,
+                    duration_s=row["duration_s"],
+                    cause=row["cause"],
+                    notified=bool(row["notified"])
+                )
+
+            if len(rows) < batch:
+                return
+            last = (rows[-1]["started_at"], rows[-1]["id"])
+            if remaining is not None:
+                remaining -= batch
+
+    def get_incidents(self, monitor_id: Optional[str] = None,
+                     open_only: bool = False, limit: Optional[int] = None,
+                     offset: int = 0) -> List[Incident]:
+        """Get incidents, optionally filtered."""
+        return list(self.iter_incidents(monitor_id, open_only, limit, offset))
 
     def resolve_incident(self, incident_id: str) -> bool:
         """Manually resolve an incident."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
         now = datetime.now()
-        
-        c.execute('SELECT started_at FROM incidents WHERE id = ?', (incident_id,))
-        row = c.fetchone()
-        if not row:
-            return False
 
-        started = datetime.fromisoformat(row[0])
-        duration = int((now - started).total_seconds())
+        # BEGIN IMMEDIATE holds the write lock across the read below
+        with self._write() as c:
+            c.execute(_SQL_SELECT_INCIDENT_START, (incident_id,))
+            row = c.fetchone()
+            if not row:
+                return False
 
-        c.execute('''
-            UPDATE incidents
-            SET resolved_at = ?, duration_s = ?
-            WHERE id = ?
-        ''', (now.isoformat(), duration, incident_id))
+            started = datetime.fromisoformat(row[0])
+            duration = int((now - started).total_seconds())
+
+            c.execute(_SQL_RESOLVE_INCIDENT, (now.isoformat(), duration, incident_id))
 
-        conn.commit()
-        conn.close()
         return True
 
     def get_heartbeat_history(self, monitor_id: str,
                              limit: int = 100) -> List[Dict]:
         """Get time series of heartbeats (up/down/response_time)."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''
-            SELECT timestamp, status, response_time_ms FROM heartbeats
-            WHERE monitor_id = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (monitor_id, limit))
-        
-        rows = c.fetchall()
-        conn.close()
-
-        history = []
-        for ts, status, response_time in reversed(rows):
-            history.append({
-                "timestamp": ts,
-                "status": status,
-                "response_time_ms": response_time
-            })
+        with self._read() as c:
+            c.row_factory = _dict_factory
+            c.execute(_SQL_SELECT_HEARTBEATS, (monitor_id, limit))
+            history = c.fetchall()
+
+        # Newest-first off the index; callers expect oldest-first
+        history.reverse()
         return history
 
+    def vacuum_old_heartbeats(self, retention_days: int = 30) -> int:
+        """Delete heartbeats older than the retention window and compact the DB.
+
+        Returns the number of heartbeats deleted.
+        """
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+
+        with self._write() as c:
+            c.execute(_SQL_DELETE_OLD_HEARTBEATS, (cutoff,))
+            deleted = c.rowcount
+
+        # These must run outside a transaction; hold the lock so no write starts
+        with self._write_lock:
+            conn = self._write_conn
+            # execute() only steps once (one page); executescript runs it to completion
+            conn.executescript('PRAGMA incremental_vacuum;')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.execute('PRAGMA optimize')
+
+        self._last_maintenance = time.monotonic()
+        return deleted
+
 
 # CLI interface
 if __name__ == "__main__":
@@ -486,6 +804,8 @@ if __name__ == "__main__":
 
     check_parser = subparsers.add_parser("check-all", help="Run all checks")
     status_parser = subparsers.add_parser("status", help="Show status")
+    vacuum_parser = subparsers.add_parser("vacuum", help="Prune old heartbeats")
+    vacuum_parser.add_argument("--retention-days", type=int, default=30)
 
     args = parser.parse_args()
     monitor = UptimeMonitor()
@@ -499,9 +819,11 @@ if __name__ == "__main__":
         for mid, status in results.items():
             print(f"{mid}: {'✓' if status else '✗'}")
     elif args.command == "status":
-        conn = sqlite3.connect(monitor.db_path)
-        c = conn.cursor()
-        c.execute('SELECT id, name, status, response_time_ms FROM monitors')
-        for mid, name, status, response_time in c.fetchall():
+        with monitor._read() as c:
+            c.execute(_SQL_SELECT_MONITOR_STATUS)
+            rows = c.fetchall()
+        for mid, name, status, response_time in rows:
             print(f"{name} ({mid}): {status} ({response_time}ms)")
-        conn.close()
+    elif args.command == "vacuum":
+        deleted = monitor.vacuum_old_heartbeats(args.retention_days)
+        print(f"Deleted {deleted} heartbeats")